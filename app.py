@@ -1,15 +1,28 @@
 import streamlit as st
-import pandas as pd
-import fitz  # PyMuPDF
-import google.generativeai as genai
-import tempfile
-import os
+import asyncio
+import functools
+import hashlib
+import io
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# pandas, fitz and google.generativeai are imported inside the functions
+# that need them: first use pays the import, later calls hit sys.modules,
+# and the cold-start render of the page skips all three
 
 # 🔑 Configure Gemini
-if "GEMINI_API_KEY" in st.secrets:
+@st.cache_resource
+def configure_gemini():
+    # Streamlit re-runs the whole script on every widget interaction;
+    # cache_resource keeps configure() to once per worker
+    import google.generativeai as genai
     genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+    return True
+
+if "GEMINI_API_KEY" in st.secrets:
+    configure_gemini()
 else:
     st.error("Missing GEMINI_API_KEY. Please add it to Streamlit Secrets.")
 
@@ -18,60 +31,425 @@ st.title("🚢 SHIPPING BILL DATA EXTRACTOR")
 
 # ---------- Helper Functions ----------
 
-def extract_text_from_pdf(file_path):
-    text = ""
-    with fitz.open(file_path) as doc:
+# Label marking the invoice section, used to decide whether the pages
+# scanned so far already cover it
+INVOICE_HINT_RE = re.compile(r"INV(?:OICE)?\s*NO", re.I)
+
+# Raw chars to pull from a PDF before giving up on later pages; the
+# payload is compacted to 6k chars afterwards, so collecting twice that
+# raw leaves headroom for the whitespace/boilerplate that compact() drops
+TEXT_BUDGET = 12000
+
+@st.cache_data(show_spinner=False, hash_funcs={bytes: lambda b: hashlib.blake2b(b, digest_size=16).digest()})
+def extract_text_from_pdf(data: bytes):
+    import fitz  # PyMuPDF
+
+    parts = []
+    found_status = False
+    scanned_through = -1
+    total = 0
+    with fitz.open(stream=data, filetype="pdf") as doc:
         for page in doc:
+            # The Status table and IGST summary sit on pages 1-2;
+            # everything after page 3 is annexures we don't need
+            if page.number >= 3:
+                break
+            scanned_through = page.number
             # Adding page markers helps the AI locate the Page 1 Status table
-            text += f"\n--- PAGE {page.number + 1} ---\n"
-            text += page.get_text("text")
-    return text.strip()
-
-def extract_with_ai(file_text, file_name):
-    # USE CASE: gemini-2.0-flash is the most stable for 2026 projects
-    MODEL_NAME = "gemini-2.0-flash" 
-    
-    prompt = f"""
-    You are a professional Customs Auditor. Extract data from this Indian Shipping Bill with 100% accuracy.
-    
-    CRITICAL INSTRUCTIONS:
-    1. .INV NO.: Extract the Invoice Number (e.g., JEHIN/2025/00090).
-    2. LUT STATUS: Go to Page 1. Locate the 'STATUS' table. Look specifically at column '11.LUT'.
-       - If the value directly below '11.LUT' is 'N', return 'N'.
-       - If the value directly below '11.LUT' is 'Y', return 'Y'.
-       - DO NOT use the IGST amount or tax presence to guess this. Only use the table value.
-    
-    Required Fields (JSON ARRAY ONLY):
-    - ".INV NO."
-    - "SB No"
-    - "SB date"
-    - "Port code"
-    - "LUT"
-    - "IGST AMT"
-
-    Document Name: {file_name}
-    Content: {file_text}
-    """
+            parts.append(f"\n--- PAGE {page.number + 1} ---\n")
+            # "blocks" skips the full-page reflow of get_text("text") and
+            # keeps each table cell visually grouped with its header
+            for block in page.get_text("blocks"):
+                block_text = block[4]
+                parts.append(block_text)
+                parts.append("\n")
+                total += len(block_text) + 1
+                if "11.LUT" in block_text:
+                    found_status = True
+            # Stop once the payload budget is filled, or once both the
+            # Status table and the IGST summary are in hand — the IGST
+            # figure can sit on the page after 11.LUT, so the Status table
+            # alone isn't licence to skip the rest
+            if total >= TEXT_BUDGET:
+                break
+            if found_status and PATTERNS["IGST AMT"].search("".join(parts)):
+                break
+
+        text = "".join(parts)
+        # Some bills push the invoice block past the pages scanned above;
+        # pull in just the first later page that mentions it instead of
+        # falling back to dumping the whole document. Returned separately
+        # so the caller's tail truncation can't cut it off again.
+        rescue = ""
+        if not INVOICE_HINT_RE.search(text):
+            for page in doc:
+                if page.number <= scanned_through:
+                    continue
+                page_text = page.get_text("text")
+                if INVOICE_HINT_RE.search(page_text):
+                    rescue = f"\n--- PAGE {page.number + 1} ---\n{page_text}"
+                    break
+    return text.strip(), rescue.strip()
+
+# Number of shipping bills sent to Gemini per request
+BATCH_SIZE = 8
+
+# Rows of the report shown per page in the UI
+PAGE_SIZE = 50
+
+# Report schema: key in the extracted rows -> final display column.
+# .INV NO. stays first per user preference.
+KEYMAP = {
+    ".INV NO.": ".INV NO.",
+    "SB No": "SB No",
+    "SB date": "SB date",
+    "Port code": '"Port code"',
+    "LUT": 'LUT "Y" or "N"',
+    "IGST AMT": '"IGST AMT"',
+    "Source": "Source",
+}
+REPORT_COLS = list(KEYMAP.values())
+
+# Compiled once for response cleanup; only exercised on the fallback
+# path now that structured output returns bare JSON
+FENCE_RE = re.compile(r"```(?:json)?\s*|\s*```")
+JSON_ARRAY_RE = re.compile(r"\[[\s\S]*\]")
+
+# Page furniture and banner lines carry no field data but cost tokens
+BOILERPLATE_RE = re.compile(r"(Page\s+\d+\s+of\s+\d+|GOVERNMENT OF INDIA|ICEGATE[^\n]*)", re.I)
+WHITESPACE_RE = re.compile(r"\s+")
+
+def compact(t: str) -> str:
+    t = BOILERPLATE_RE.sub("", t)
+    t = WHITESPACE_RE.sub(" ", t)
+    return t.strip()
+
+# ICEGATE bills are fixed-template, so most fields sit at known labels.
+# Compiled once; a full match lets us skip the Gemini call entirely.
+PATTERNS = {
+    ".INV NO.": re.compile(r"(?:INV(?:OICE)?\s*NO)[.:]?\s*([A-Z]{2,}[A-Z0-9/\-]*\d)", re.I),
+    "SB No": re.compile(r"SB\s*No[.:]?\s*(\d{7})"),
+    "SB date": re.compile(r"SB\s*Date[.:]?\s*(\d{2}[-/][A-Z]{3}[-/]\d{2,4})"),
+    "Port code": re.compile(r"\b(IN[A-Z]{3}\d)\b"),
+    "IGST AMT": re.compile(r"IGST[^\d]{0,20}([\d,]+\.\d{2})"),
+    "LUT": re.compile(r"11\.?\s*LUT\s*[:\|]?\s*([YN])\b"),
+}
+
+# Extraction results persist across sessions keyed by PDF content hash,
+# so re-uploading the same bill never re-pays the Gemini call
+CACHE_DIR = Path(".cache")
+CACHE_DIR.mkdir(exist_ok=True)
+
+def cache_lookup(file_hash):
+    path = CACHE_DIR / f"{file_hash}.json"
+    return json.loads(path.read_text()) if path.exists() else None
+
+def cache_store(file_hash, row):
+    (CACHE_DIR / f"{file_hash}.json").write_text(json.dumps(row))
+
+def fast_extract(text, seed=None):
+    # Returns a complete row, or None if any field is missing
+    # (in which case the document falls back to the AI path).
+    # seed carries fields already resolved deterministically elsewhere.
+    row = dict(seed or {})
+    for field, pattern in PATTERNS.items():
+        if field in row:
+            continue
+        match = pattern.search(text)
+        if not match:
+            return None
+        row[field] = match.group(1)
+    return row
+
+def extract_lut_from_layout(data):
+    # The LUT flag is the single cell directly below the "11.LUT" header
+    # of the page-1 Status table; word coordinates make that lookup exact
+    # where free-text reading has to guess which Y/N belongs to which column
+    import fitz  # PyMuPDF
+
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        if doc.page_count == 0:
+            return None
+        words = doc[0].get_text("words")
+    header = next((w for w in words if w[4] == "11.LUT"), None)
+    if header is None:
+        return None
+    x0, _, x1, y1 = header[:4]
+    # First Y/N strictly below the header whose x-range overlaps it
+    below = [w for w in words if w[1] > y1 and w[4] in ("Y", "N") and w[0] < x1 and w[2] > x0]
+    if not below:
+        return None
+    return min(below, key=lambda w: w[1])[4]
+
+# USE CASE: gemini-2.0-flash is the most stable for 2026 projects,
+# but the sidebar lets the auditor trade speed for a newer tier
+MODEL_NAME = st.sidebar.selectbox("Model", ["gemini-2.0-flash", "gemini-1.5-flash", "gemini-2.5-flash"])
+
+# Static prompt parts kept separate so they can be cached server-side;
+# only the per-batch document payload changes between calls
+PERSONA = "You are a professional Customs Auditor. Extract data from Indian Shipping Bills with 100% accuracy."
+
+PROMPT_PREFIX = """
+CRITICAL INSTRUCTIONS:
+1. .INV NO.: Extract the Invoice Number (e.g., JEHIN/2025/00090).
+2. LUT STATUS: Go to Page 1. Locate the 'STATUS' table. Look specifically at column '11.LUT'.
+   - If the value directly below '11.LUT' is 'N', return 'N'.
+   - If the value directly below '11.LUT' is 'Y', return 'Y'.
+   - DO NOT use the IGST amount or tax presence to guess this. Only use the table value.
+3. The array MUST contain exactly one object per input document, in input order.
+4. Copy each document's "Source" value into its output object verbatim.
+
+Required Fields (JSON ARRAY ONLY):
+- ".INV NO."
+- "SB No"
+- "SB date"
+- "Port code"
+- "LUT"
+- "IGST AMT"
+- "Source"
+"""
+
+# Structured-output mode: Gemini is forced to emit valid JSON matching
+# this schema, so no markdown fences or prose can leak into the response
+GENERATION_CONFIG = {
+    # Extraction is deterministic work: no sampling, and a hard cap well
+    # above a full batch of rows so a runaway response can't stall a call
+    "temperature": 0,
+    "max_output_tokens": 2048,
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                ".INV NO.": {"type": "string"},
+                "SB No": {"type": "string"},
+                "SB date": {"type": "string"},
+                "Port code": {"type": "string"},
+                "LUT": {"type": "string", "enum": ["Y", "N"]},
+                "IGST AMT": {"type": "number"},
+                "Source": {"type": "string"},
+            },
+            "required": ["SB No", "Source"],
+        },
+    },
+}
+
+@functools.lru_cache(maxsize=4)
+def get_model(name):
+    # One client handle per model name instead of a new one per call
+    import google.generativeai as genai
+    return genai.GenerativeModel(name)
+
+def get_cached_model():
+    # Cache the static instructions server-side so repeat batches only
+    # pay for the document payload. Returns None if caching is unavailable.
+    import google.generativeai as genai
+
+    # Keyed per model so switching in the sidebar doesn't reuse a
+    # prefix cached against the previous one
+    cache_key = f"cache_name_{MODEL_NAME}"
+    unavailable_key = f"cache_unavailable_{MODEL_NAME}"
+    # Once create has failed (prefix under the minimum cacheable token
+    # count, or no -001 variant of this model), don't re-pay the failed
+    # round-trip on every batch
+    if st.session_state.get(unavailable_key):
+        return None
+
+    def create():
+        cache = genai.caching.CachedContent.create(
+            model=f"models/{MODEL_NAME}-001",
+            system_instruction=PERSONA,
+            contents=[PROMPT_PREFIX],
+            ttl="600s",
+        )
+        st.session_state[cache_key] = cache.name
+        return cache
+
+    try:
+        if cache_key in st.session_state:
+            try:
+                cache = genai.caching.CachedContent.get(st.session_state[cache_key])
+            except Exception:
+                # TTL expired: evict the stale name and recreate once
+                del st.session_state[cache_key]
+                cache = create()
+        else:
+            cache = create()
+        return genai.GenerativeModel.from_cached_content(cached_content=cache)
+    except Exception:
+        st.session_state[unavailable_key] = True
+        return None
 
+def parse_partial_rows(buf):
+    # Best-effort parse of a truncated streamed response: take everything
+    # from the opening bracket to the last complete object and close the array
+    clean = FENCE_RE.sub("", buf).strip()
+    start = clean.find("[")
+    end = clean.rfind("}")
+    if start == -1 or end == -1:
+        return None
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(prompt)
-        
-        # Robust cleaning of AI response
-        clean_text = response.text.replace('```json', '').replace('```', '').strip()
-        match = re.search(r"\[.*\]", clean_text, re.DOTALL)
-        
+        return json.loads(clean[start:end + 1] + "]")
+    except ValueError:
+        return None
+
+def build_payload(batch_texts):
+    # Only Source and Text go over the wire; internal keys like the
+    # content hash stay local
+    docs = [{"Source": d["Source"], "Text": d["Text"]} for d in batch_texts]
+    # Compact separators and raw UTF-8: no whitespace tokens, and Indian
+    # addresses / ₹ stay 2-3 bytes instead of \uXXXX escapes
+    encoded = json.dumps(docs, separators=(",", ":"), ensure_ascii=False)
+    # Dynamic content goes last so the cached prefix stays byte-identical
+    return f"These are {len(docs)} documents (JSON): {encoded}"
+
+def parse_response(text):
+    # Structured mode guarantees valid JSON; keep the old fence/regex
+    # scrape only as a fallback for models that ignore the schema
+    try:
+        return json.loads(text)
+    except ValueError:
+        clean_text = FENCE_RE.sub("", text).strip()
+        match = JSON_ARRAY_RE.search(clean_text)
         return json.loads(match.group(0)) if match else []
+
+def validate_count(rows, batch_texts):
+    # The prompt demands one object per input document; flag drift so a
+    # silently dropped bill doesn't go unnoticed in the report
+    if len(rows) != len(batch_texts):
+        names = ", ".join(d["Source"] for d in batch_texts)
+        st.warning(f"Expected {len(batch_texts)} rows but got {len(rows)} for: {names}. Check these bills in the report.")
+    return rows
+
+def report_ai_error(e, batch_texts):
+    # Handle Quota Limit 0 Error specifically for the user
+    names = ", ".join(d["Source"] for d in batch_texts)
+    if "429" in str(e):
+        st.error(f"Quota Error for {names}: Your API key has a 'Limit 0'. Please link a billing account in Google AI Studio to unlock the free tier.")
+    elif "404" in str(e):
+        st.error(f"Model Error: {MODEL_NAME} is not found. Check if your API key is restricted to specific regions.")
+    else:
+        st.error(f"Error: {e}")
+
+def extract_with_ai(batch_texts, preview=None):
+    import pandas as pd
+
+    payload = build_payload(batch_texts)
+
+    try:
+        model = get_cached_model()
+        if model is not None:
+            response = model.generate_content(payload, generation_config=GENERATION_CONFIG, stream=True)
+        else:
+            # Uncached fallback: ship the full prompt every call
+            model = get_model(MODEL_NAME)
+            response = model.generate_content(
+                f"{PERSONA}\n{PROMPT_PREFIX}\n{payload}",
+                generation_config=GENERATION_CONFIG,
+                stream=True,
+            )
+
+        # Consume the stream, surfacing rows as soon as each object closes
+        # instead of sitting silent until the final token
+        buf = ""
+        shown = 0
+        for chunk in response:
+            buf += chunk.text
+            if preview is not None:
+                rows = parse_partial_rows(buf)
+                if rows and len(rows) > shown:
+                    shown = len(rows)
+                    preview.dataframe(pd.DataFrame(rows))
+
+        return validate_count(parse_response(buf), batch_texts)
     except Exception as e:
-        # Handle Quota Limit 0 Error specifically for the user
-        if "429" in str(e):
-            st.error(f"Quota Error for {file_name}: Your API key has a 'Limit 0'. Please link a billing account in Google AI Studio to unlock the free tier.")
-        elif "404" in str(e):
-            st.error(f"Model Error: {MODEL_NAME} is not found. Check if your API key is restricted to specific regions.")
+        report_ai_error(e, batch_texts)
+        return []
+
+async def call_batch_async(batch_texts, sem, model, cached):
+    # Same request as extract_with_ai, but awaitable so several batches
+    # can be in flight at once. The model handle comes from the caller:
+    # resolving it here would run blocking cache I/O inside the loop.
+    payload = build_payload(batch_texts)
+    if not cached:
+        payload = f"{PERSONA}\n{PROMPT_PREFIX}\n{payload}"
+    async with sem:
+        response = await model.generate_content_async(payload, generation_config=GENERATION_CONFIG)
+    return validate_count(parse_response(response.text), batch_texts)
+
+def extract_batches_async(chunks):
+    # Fire all batch requests concurrently; the semaphore keeps us under
+    # the API's per-minute quota. Returns one result list per chunk.
+    # Resolve the model once before entering the event loop —
+    # get_cached_model does blocking network I/O and calling it per task
+    # under the semaphore would partially serialize the gather.
+    model = get_cached_model()
+    cached = model is not None
+    if not cached:
+        model = get_model(MODEL_NAME)
+
+    async def run():
+        sem = asyncio.Semaphore(5)
+        return await asyncio.gather(
+            *(call_batch_async(c, sem, model, cached) for c in chunks),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    out = []
+    for chunk, res in zip(chunks, results):
+        if isinstance(res, Exception):
+            report_ai_error(res, chunk)
+            out.append([])
         else:
-            st.error(f"Error: {e}")
+            out.append(res)
+    return out
+
+def extract_from_pdf_bytes(name, data, file_hash):
+    # Scanned bills have no usable text layer, so the local parse and the
+    # text prompt are both blind. Hand Gemini the PDF itself via the Files
+    # API; the handle is kept in session state so reruns don't re-upload.
+    import google.generativeai as genai
+    try:
+        key = f"gemini_file_{file_hash}"
+        if key in st.session_state:
+            handle = st.session_state[key]
+        else:
+            handle = genai.upload_file(io.BytesIO(data), mime_type="application/pdf")
+            st.session_state[key] = handle
+        model = get_model(MODEL_NAME)
+        prompt = f'{PERSONA}\n{PROMPT_PREFIX}\nThere is 1 document. Its "Source" is {name!r}.'
+        response = model.generate_content([handle, prompt], generation_config=GENERATION_CONFIG)
+        return parse_response(response.text)
+    except Exception as e:
+        report_ai_error(e, [{"Source": name}])
         return []
 
+def process_one(name, data, file_hash):
+    # Text extraction only; AI calls are batched after all files are parsed.
+    # A cache hit skips even the PDF parse.
+    cached = cache_lookup(file_hash)
+    if cached is not None:
+        cached["Source"] = name
+        return {"Source": name, "hash": file_hash, "row": cached}
+    text, invoice_rescue = extract_text_from_pdf(data)
+    # The rescued invoice page gets its slice of the 6k payload budget
+    # first; dense bills can no longer truncate it off the tail
+    rescue_part = compact(invoice_rescue)[:2000] if invoice_rescue else ""
+    compacted = compact(text)[:6000 - len(rescue_part)]
+    if rescue_part:
+        compacted = f"{compacted} {rescue_part}"
+    if len(compacted) < 200:
+        # Effectively no text layer (scanned bill): route the raw PDF
+        # to Gemini instead of an empty prompt
+        return {"Source": name, "hash": file_hash, "needs_pdf": True, "data": data}
+    doc = {"Source": name, "hash": file_hash, "Text": compacted}
+    lut = extract_lut_from_layout(data)
+    if lut is not None:
+        doc["LUT"] = lut
+    return doc
+
 # ---------- UI Layout ----------
 
 uploaded_files = st.file_uploader("Upload Shipping Bill PDFs", type=["pdf"], accept_multiple_files=True)
@@ -80,43 +458,137 @@ if uploaded_files:
     if st.button("Generate Accurate Excel Report"):
         all_data = []
         with st.spinner("AI is scanning tables for accuracy..."):
+            # The same bill is often uploaded twice (or under two names);
+            # hash contents and process each unique blob exactly once
+            unique_uploads = {}
+            name_to_hash = {}
             for uploaded in uploaded_files:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(uploaded.read())
-                    text = extract_text_from_pdf(tmp.name)
-                os.remove(tmp.name)
-                
-                # Send context to AI
-                res = extract_with_ai(text, uploaded.name)
+                # getvalue() returns the whole buffer without consuming a
+                # cursor; read once here and reuse the same bytes for
+                # hashing and parsing
+                data = uploaded.getvalue()
+                file_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+                unique_uploads.setdefault(file_hash, (uploaded.name, data))
+                name_to_hash[uploaded.name] = file_hash
+
+            # Files are independent and parsing is I/O-bound,
+            # so fan them out across threads instead of looping serially
+            items = [(name, data, h) for h, (name, data) in unique_uploads.items()]
+            with ThreadPoolExecutor(max_workers=min(8, len(items))) as ex:
+                batch_texts = list(ex.map(lambda item: process_one(*item), items))
+
+            # Happy paths: previously-seen or fully regex-parsed bills never reach the AI
+            pending = []
+            for doc in batch_texts:
+                if "row" in doc:
+                    all_data.append(doc["row"])
+                    continue
+                if doc.get("needs_pdf"):
+                    # Scanned bill: Gemini reads the PDF natively
+                    for row in extract_from_pdf_bytes(doc["Source"], doc["data"], doc["hash"]):
+                        row["Source"] = doc["Source"]
+                        cache_store(doc["hash"], row)
+                        all_data.append(row)
+                    continue
+                row = fast_extract(doc["Text"], seed={"LUT": doc["LUT"]} if "LUT" in doc else None)
+                if row is not None:
+                    row["Source"] = doc["Source"]
+                    cache_store(doc["hash"], row)
+                    all_data.append(row)
+                else:
+                    pending.append(doc)
+
+            # One Gemini call per chunk of remaining bills instead of one per file
+            chunks = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+            if len(chunks) > 1:
+                # Several batches: fire them all concurrently
+                results = extract_batches_async(chunks)
+            elif chunks:
+                # Single batch: stream it so rows appear as they arrive
+                preview = st.empty()
+                results = [extract_with_ai(chunks[0], preview)]
+                preview.empty()
+            else:
+                results = []
+
+            for chunk, res in zip(chunks, results):
                 if res:
+                    hash_by_source = {d["Source"]: d["hash"] for d in chunk}
+                    lut_by_source = {d["Source"]: d["LUT"] for d in chunk if "LUT" in d}
+                    for row in res:
+                        source = row.get("Source")
+                        # The layout-derived LUT beats whatever the model read
+                        if source in lut_by_source:
+                            row["LUT"] = lut_by_source[source]
+                        row_hash = hash_by_source.get(source)
+                        if row_hash:
+                            cache_store(row_hash, row)
                     all_data.extend(res)
 
+            # Fan rows from unique blobs back out to every filename that
+            # referenced them, so duplicates still show up in the report.
+            # Strictly additive: every extracted row stays (even if the
+            # model mangled its Source), and only filenames with no row of
+            # their own get a copy of their blob's row appended.
+            source_to_hash = {d["Source"]: d["hash"] for d in batch_texts}
+            hash_to_row = {}
+            for row in all_data:
+                row_hash = source_to_hash.get(row.get("Source"))
+                if row_hash:
+                    hash_to_row[row_hash] = row
+            extracted_names = {row.get("Source") for row in all_data}
+            for name, file_hash in name_to_hash.items():
+                if name not in extracted_names and file_hash in hash_to_row:
+                    all_data.append({**hash_to_row[file_hash], "Source": name})
+
         if all_data:
-            df = pd.DataFrame(all_data)
-            
-            # 1. Ensure .INV NO. is the first column
-            # 2. Reorder according to user preference
-            desired_order = [".INV NO.", "SB No", "SB date", "Port code", "LUT", "IGST AMT"]
-            
-            # Safety check for missing columns
-            for col in desired_order:
-                if col not in df.columns:
-                    df[col] = "Not Found"
-            
-            df = df[desired_order]
-
-            # 3. Rename columns for final display
-            df.rename(columns={
-                "LUT": 'LUT "Y" or "N"', 
-                "IGST AMT": '"IGST AMT"', 
-                "Port code": '"Port code"'
-            }, inplace=True)
-            
+            import pandas as pd
+
+            # Normalize every row to the full schema up front so the frame
+            # is built in one allocation — no rename, no reindex, no
+            # per-column "missing?" patching
+            rows = [tuple(r.get(src, "Not Found") for src in KEYMAP) for r in all_data]
+            df = pd.DataFrame.from_records(rows, columns=REPORT_COLS)
+
+            # Typed columns: "string" dtype is far smaller than object for
+            # big audit runs, and numeric IGST unlocks SUM/filters in Excel
+            igst_col = KEYMAP["IGST AMT"]
+            df[igst_col] = pd.to_numeric(
+                df[igst_col].astype(str).str.replace(",", ""), errors="coerce"
+            ).astype("Float64")
+            for col in REPORT_COLS:
+                if col != igst_col:
+                    df[col] = df[col].astype("string")
+
+            # Kept in session state so the paginator below survives the
+            # rerun each widget interaction triggers
+            st.session_state["report_df"] = df
             st.success("✅ Extraction Complete")
-            st.dataframe(df)
 
-            # 4. Excel Export
-            excel_name = "Shipping_Bill_Data_Report.xlsx"
-            df.to_excel(excel_name, index=False)
-            with open(excel_name, "rb") as f:
-                st.download_button("📥 Download Excel Report", f, file_name=excel_name)
+if "report_df" in st.session_state:
+    import pandas as pd
+
+    df = st.session_state["report_df"]
+
+    # Only one page of rows goes to the browser at a time; big audit
+    # frames re-serialized on every rerun bog the frontend down
+    if len(df) > PAGE_SIZE:
+        pages = (len(df) - 1) // PAGE_SIZE + 1
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1)
+        st.dataframe(df.iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE])
+    else:
+        st.dataframe(df)
+
+    # 4. Excel Export (built in memory; nothing touches the disk).
+    # NOTE: xlsxwriter's constant_memory mode is off limits here — it
+    # requires strictly ascending row writes, and pandas' to_excel writes
+    # the body column by column, which silently drops cells in that mode.
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
+        df.to_excel(writer, index=False, sheet_name="Bills")
+    st.download_button(
+        "📥 Download Excel Report",
+        buf.getvalue(),
+        file_name="Shipping_Bill_Data_Report.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )